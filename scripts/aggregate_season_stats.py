@@ -1,8 +1,8 @@
 import os
+import copy
 import datetime as dt
-import pickle
-import gzip
 import pprint
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -12,52 +12,84 @@ import watchcbb.teams
 import watchcbb.utils as utils
 import watchcbb.efficiency as eff
 
-sql = SQLEngine('cbb')
 
-TODAY = dt.date(2019,11,5)
-while TODAY <= dt.date(2020,03,11):
+def snapshot(today, season, season_stats_df, schedules, ngames):
+    """
+    Compute advanced stats and efficiency ratings from the season totals as of <today>
+    (with <ngames> games played so far), and write them to a compressed pickle
+    """
 
-    print(f"Doing date {TODAY}")
-
-    SEASON = TODAY.year if TODAY.month < 6 else TODAY.year+1
-
-    df_games = sql.df_from_query(""" 
-        SELECT * FROM game_data
-        WHERE "Season"={season} AND "Date"<'{today}'
-        ORDER BY "Date"
-    """.format(season=SEASON, today=TODAY))
-
-    df_teams = sql.df_from_query("""
-        SELECT * from teams
-        WHERE year_start<={season} AND year_end>={season}
-    """.format(season=SEASON))
-    teams = watchcbb.teams.teams_from_df(df_teams)
-
-    df_preseason = sql.df_from_query("""
-        SELECT * from preseason_predictions
-        WHERE year={season}
-    """.format(season=SEASON))
-
-    season_stats_dict = utils.compute_season_stats(df_games, df_preseason=df_preseason, 
-                                                   force_all_teams=True, tids=teams.keys(), years=[SEASON])
-    season_stats_df = utils.stats_dict_to_df(season_stats_dict)
     utils.add_advanced_stats(season_stats_df)
-    season_stats_dict = utils.stats_df_to_dict(season_stats_df)
 
     # convergence parameter
-    p = 0.9 + 0.1*min(1000,df_games.shape[0])/1000
+    p = 0.9 + 0.1*min(1000,ngames)/1000
     # preseason blend fraction
-    preseason_blend = utils.get_blend_param(df_games.shape[0] / 5400.)
-    eff.compute_efficiency_ratings(season_stats_dict, conv_param=p, preseason_blend=preseason_blend)
-    season_stats_df = utils.stats_dict_to_df(season_stats_dict)
+    preseason_blend = utils.get_blend_param(ngames / 5400.)
+    eff.compute_efficiency_ratings(season_stats_df, schedules, conv_param=p, preseason_blend=preseason_blend)
+    season_stats_dict = utils.stats_df_to_dict(season_stats_df)
 
     # print(season_stats_df.columns)
-    # pprint.PrettyPrinter(indent=4).pprint(season_stats_dict[SEASON]['purdue'])
+    # pprint.PrettyPrinter(indent=4).pprint(season_stats_dict[season]['purdue'])
     # print(season_stats_df.sort_values("Tneteff", ascending=False)[["team_id","CompositeRating","Tneteff"]].head(20))
-    # break
- 
-    os.makedirs(f'../data/season_stats/{SEASON}', exist_ok=True)
-    with gzip.open('../data/season_stats/{0}/{1}.pkl.gz'.format(SEASON, TODAY), 'wb') as fid:
-        pickle.dump((season_stats_dict, season_stats_df), fid, protocol=-1)
 
-    TODAY += dt.timedelta(1)
+    os.makedirs(f'../data/season_stats/{season}', exist_ok=True)
+    # snapshots already run one per core, so compress within this process rather than spawning more threads
+    utils.save_season_stats(f'../data/season_stats/{season}', today, season_stats_dict, season_stats_df, threads=0)
+
+    return today
+
+
+if __name__=="__main__":
+
+    sql = SQLEngine('cbb')
+
+    STARTDATE = dt.date(2019,11,5)
+    ENDDATE = dt.date(2020,3,11)
+
+    get_season = lambda date: date.year if date.month < 6 else date.year+1
+
+    # the per-day efficiency ratings are independent of each other, so farm them out to worker processes.
+    # each worker gets its own copy of the running totals as of that day
+    with ProcessPoolExecutor() as executor:
+        futures = []
+        for SEASON in range(get_season(STARTDATE), get_season(ENDDATE)+1):
+
+            # none of these change within a season (games are only added), so query each once per season
+            df_allgames = sql.df_from_query("""
+                SELECT * FROM game_data
+                WHERE "Season"={season}
+                ORDER BY "Date"
+            """.format(season=SEASON))
+
+            df_teams = sql.df_from_query("""
+                SELECT * from teams
+                WHERE year_start<={season} AND year_end>={season}
+            """.format(season=SEASON))
+            teams = watchcbb.teams.teams_from_df(df_teams)
+
+            df_preseason = sql.df_from_query("""
+                SELECT * from preseason_predictions
+                WHERE year={season}
+            """.format(season=SEASON))
+
+            # running season totals. Each day we only fold in the games played since the previous day
+            season_totals_df, schedules = utils.compute_season_stats_df(df_allgames.iloc[:0], df_preseason=df_preseason,
+                                                                        force_all_teams=True, tids=teams.keys(), years=[SEASON])
+            ngames = 0
+
+            TODAY = max(STARTDATE, dt.date(SEASON-1,6,1))
+            while TODAY <= min(ENDDATE, dt.date(SEASON,5,31)):
+
+                # games are sorted by date, so the games before TODAY are a prefix of df_allgames,
+                # and only the rows past the first ngames are new since the last snapshot
+                nbefore = df_allgames.Date.searchsorted(TODAY)
+                utils.update_season_stats(season_totals_df, schedules, df_allgames.iloc[ngames:nbefore])
+                ngames = nbefore
+
+                futures.append(executor.submit(snapshot, TODAY, SEASON, season_totals_df.copy(),
+                                               copy.deepcopy(schedules), ngames))
+
+                TODAY += dt.timedelta(1)
+
+        for future in futures:
+            print(f"Done date {future.result()}")
@@ -12,4 +12,5 @@ for year in range(2020,2010,-1):
         continue
 
     print("Getting games for year "+str(year))
-    sr.get_game_data(year, fout=fout, overwrite=True, verbose=True)
+    # the most recent season may still be in progress, so don't trust any cached pages for it
+    sr.get_game_data(year, fout=fout, overwrite=True, verbose=True, cache=True, force_refresh=(year==2020))
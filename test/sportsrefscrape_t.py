@@ -0,0 +1,97 @@
+import datetime as dt
+import unittest
+
+from watchcbb.scrape.SportsRefScrape import SportsRefScrape
+
+STATS = ["pts","fg","fga","fg3","fg3a","ft","fta","orb","trb","ast","stl","blk","tov","pf"]
+
+def gamelog_row(i, date, opp, loc, pts, opp_pts, nOT=0):
+    """ One row of a sports-reference gamelogs table. opp=None for a non-D-I opponent (no link) """
+    opp_td = f'<a href="/cbb/schools/{opp}/2020.html">{opp}</a>' if opp else 'Some College'
+    result = ("W" if pts > opp_pts else "L") + (f' <small>({nOT} OT)</small>' if nOT else '')
+    tds = [f'<td data-stat="date_game"><a href="/cbb/boxscores/{date}.html">{date}</a></td>',
+           f'<td data-stat="game_location">{loc}</td>',
+           f'<td data-stat="opp_id">{opp_td}</td>',
+           f'<td data-stat="game_result">{result}</td>']
+    # every stat other than points is 10+index for the team and 20+index for the opponent, except blocks
+    # which are left blank (as they are on the site for some older games)
+    for j, stat in enumerate(STATS):
+        val, opp_val = (pts, opp_pts) if stat=="pts" else (10+j, 20+j)
+        if stat=="blk":
+            val, opp_val = "", ""
+        tds.append(f'<td data-stat="{stat}">{val}</td>')
+        tds.append(f'<td data-stat="opp_{stat}">{opp_val}</td>')
+    return f'<tr id="sgl-basic.{i}">{"".join(tds)}</tr>'
+
+GAMELOGS = ('<html><body><table id="sgl-basic"><thead><tr><th>G</th></tr></thead><tbody>' +
+            gamelog_row(1, "2019-11-05", "indiana", "", 70, 60) +
+            gamelog_row(2, "2019-11-08", "iowa", "@", 75, 80, nOT=1) +
+            gamelog_row(3, "2019-11-20", None, "", 90, 50) +
+            '<tr class="thead"><td>G</td></tr>' +
+            gamelog_row(4, "2020-03-12", "michigan", "N", 65, 64) +
+            '</tbody></table></body></html>').encode()
+
+SCHEDULE = ('<html><body><table id="schedule"><tbody>' +
+            ''.join(f'<tr><td data-stat="date_game" csk="{date}">{date}</td><td data-stat="game_type">{gtype}</td></tr>'
+                    for date, gtype in [("2019-11-05","REG"), ("2019-11-08","REG"), ("2019-11-20","REG"), ("2020-03-12","CTOURN")]) +
+            '</tbody></table></body></html>').encode()
+
+class TestSportsRefScrape(unittest.TestCase):
+
+    sr = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.sr = SportsRefScrape()
+
+    def test_parse_team(self):
+        seen = set()
+        rows = self.sr.parse_team("purdue", (GAMELOGS, SCHEDULE), 2020, seen)
+        # the game against a non-D-I opponent is dropped
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(seen, {"2019-11-05_indiana_purdue", "2019-11-08_iowa_purdue", "2020-03-12_michigan_purdue"})
+
+        # home win in regulation
+        self.assertEqual(rows[0][:9], (2020, "2019-11-05", "RG", "purdue", 70, "indiana", 60, "H", 0))
+        self.assertEqual(len(rows[0]), 35)
+        # winner FGM/FGA, then DR = TRB-ORB, and blank blocks count as 0
+        self.assertEqual(rows[0][9:11], (11, 12))
+        self.assertEqual(rows[0][16], 18-17)
+        self.assertEqual(rows[0][20], 0)
+        self.assertEqual(rows[0][22:24], (21, 22))
+
+        # road overtime loss: the winner is the opponent, who was at home
+        self.assertEqual(rows[1][:9], (2020, "2019-11-08", "RG", "iowa", 80, "purdue", 75, "H", 1))
+        self.assertEqual(rows[1][9:11], (21, 22))
+
+        # neutral site conference tournament game
+        self.assertEqual(rows[2][:9], (2020, "2020-03-12", "CT", "purdue", 65, "michigan", 64, "N", 0))
+
+        # games already seen (e.g. from the opponent's page) are skipped
+        self.assertEqual(self.sr.parse_team("purdue", (GAMELOGS, SCHEDULE), 2020, seen), [])
+
+        # as are games seen listed a day earlier
+        rows = self.sr.parse_team("purdue", (GAMELOGS, SCHEDULE), 2020, {"2019-11-07_iowa_purdue"})
+        self.assertEqual([r[1] for r in rows], ["2019-11-05", "2020-03-12"])
+
+    def test_parse_team_filters(self):
+        # without the schedule page, every game is taken as regular season
+        rows = self.sr.parse_team("purdue", (GAMELOGS, None), 2020, set(),
+                                  startdate=dt.date(2019,11,6), enddate=dt.date(2020,3,31))
+        self.assertEqual([(r[1], r[2]) for r in rows], [("2019-11-08", "RG"), ("2020-03-12", "RG")])
+
+        rows = self.sr.parse_team("purdue", (GAMELOGS, SCHEDULE), 2020, set(),
+                                  gids_to_get=["2019-11-05_indiana_purdue"])
+        self.assertEqual([r[1] for r in rows], ["2019-11-05"])
+
+    def test_parse_team_missing_table(self):
+        # e.g. the body of a rate-limited or missing page
+        error_page = b"<html><body><h1>429 Too Many Requests</h1></body></html>"
+        with self.assertRaises(Exception):
+            self.sr.parse_team("purdue", (error_page, SCHEDULE), 2020, set())
+        with self.assertRaises(Exception):
+            self.sr.parse_team("purdue", (GAMELOGS, error_page), 2020, set())
+
+
+if __name__=="__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import gzip
+import pickle
+import tempfile
+import unittest
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+import watchcbb.utils as utils
+import watchcbb.efficiency as eff
+
+class TestUtils(unittest.TestCase):
+
+    df = None
+
+    @classmethod
+    def setUpClass(cls):
+        # three games between three teams, in chronological order
+        rows = [
+            [2020, "2019-11-05", "purdue", "indiana", "H", 0, 70.0],
+            [2020, "2019-11-08", "indiana", "iowa", "A", 1, 80.0],
+            [2020, "2019-11-12", "purdue", "iowa", "N", 0, 65.0],
+        ]
+        cls.df = pd.DataFrame(rows, columns=["Season","Date","WTeamID","LTeamID","WLoc","NumOT","poss"])
+        for i, sn in enumerate(utils.STATNAMES):
+            cls.df["W"+sn] = [60+i, 50+i, 70+i]
+            cls.df["L"+sn] = [55+i, 45+i, 40+i]
+
+    def test_compute_season_stats(self):
+        stats_df, schedules = utils.compute_season_stats_df(self.df)
+        stats = utils.stats_df_to_dict(stats_df)
+        self.assertEqual(sorted(stats[2020].keys()), ["indiana", "iowa", "purdue"])
+
+        d = stats[2020]["indiana"]
+        self.assertEqual((d["wins"], d["losses"], d["totOT"]), (1, 1, 1))
+        self.assertEqual(d["TScore"], 55+50)
+        self.assertEqual(d["OScore"], 60+45)
+        d = schedules[(2020,"indiana")]
+        self.assertEqual(list(d["opps"]), ["purdue", "iowa"])
+        self.assertEqual(d["scores"].tolist(), [[55,60], [50,45]])
+        self.assertEqual(list(d["HA"]), ["A", "A"])
+        self.assertEqual(list(d["poss"]), [70.0, 80.0])
+        self.assertEqual(list(d["nOT"]), [0, 1])
+        self.assertEqual(list(schedules[(2020,"iowa")]["HA"]), ["H", "N"])
+
+    def test_compute_season_stats_force_all_teams(self):
+        stats_df, schedules = utils.compute_season_stats_df(self.df.iloc[:1], force_all_teams=True,
+                                                            tids=["purdue", "indiana", "iowa"], years=[2020])
+        stats = utils.stats_df_to_dict(stats_df)
+        self.assertEqual(len(stats[2020]), 3)
+        self.assertEqual(stats[2020]["iowa"]["wins"] + stats[2020]["iowa"]["losses"], 0)
+        self.assertEqual(len(schedules[(2020,"iowa")]["opps"]), 0)
+        with self.assertRaises(Exception):
+            utils.compute_season_stats_df(self.df, force_all_teams=True)
+        with self.assertRaises(Exception):
+            utils.compute_season_stats_df(self.df, years=[2019])
+
+    def test_compute_season_stats_df(self):
+        stats_df, schedules = utils.compute_season_stats_df(self.df)
+        self.assertEqual(list(stats_df.columns[:2]), ["year", "team_id"])
+        self.assertEqual(list(stats_df.team_id), ["indiana", "iowa", "purdue"])
+        self.assertEqual(list(schedules[(2020,"purdue")]["opps"]), ["indiana", "iowa"])
+        self.assertEqual(schedules[(2020,"purdue")]["scores"].tolist(), [[60,55], [70,40]])
+
+        stats = utils.stats_df_to_dict(stats_df)
+        self.assertEqual(stats[2020]["purdue"]["wins"], 2)
+        self.assertEqual(stats[2020]["purdue"]["TScore"], 60+70)
+
+    def test_compute_efficiency_ratings(self):
+        # michigan hasn't played yet, so only has its preseason rating.
+        # reference values are from the original dict-based implementation
+        df_preseason = pd.DataFrame({"year":2020, "team_id":["purdue","indiana","iowa","michigan"],
+                                     "pred_eff":[10.0,5.0,-2.0,8.0], "pred_oeff":[110.0,105.0,100.0,108.0],
+                                     "pred_deff":[100.0,100.0,102.0,100.0], "pred_pace":[68.0,70.0,66.0,72.0]})
+        stats_df, schedules = utils.compute_season_stats_df(self.df, df_preseason=df_preseason, force_all_teams=True,
+                                                            tids=["purdue","indiana","iowa","michigan"], years=[2020])
+        with self.assertRaises(Exception):
+            eff.compute_efficiency_ratings(stats_df, schedules)
+        utils.add_advanced_stats(stats_df)
+        eff.compute_efficiency_ratings(stats_df, schedules, preseason_blend=0.3)
+
+        d = stats_df.set_index("team_id")
+        self.assertEqual(list(d.index), ["indiana", "iowa", "michigan", "purdue"])
+        np.testing.assert_allclose(d.Tcorroeff, [65.23083206207453, 60.76417757854154, 0.0, 63.12442074546587], rtol=1e-9)
+        np.testing.assert_allclose(d.Tcorrdeff, [61.12658843914639, 64.22268859384899, 999.0, 64.08613955804454], rtol=1e-9)
+        np.testing.assert_allclose(d.pace, [72.56326952924528, 67.38069136380265, np.nan, 66.329007113263], rtol=1e-9)
+        np.testing.assert_allclose(d.CompositeRating, [4.372970536049696, -3.020957710715211, 8.0, 2.326796831194933], rtol=1e-9)
+
+    def test_update_season_stats(self):
+        tids = ["purdue", "indiana", "iowa"]
+        stats_df, schedules = utils.compute_season_stats_df(self.df.iloc[:1], force_all_teams=True,
+                                                            tids=tids, years=[2020])
+        utils.update_season_stats(stats_df, schedules, self.df.iloc[1:])
+        full_df, full_schedules = utils.compute_season_stats_df(self.df, force_all_teams=True,
+                                                                tids=tids, years=[2020])
+        pd.testing.assert_frame_equal(stats_df, full_df)
+        self.assertEqual(schedules.keys(), full_schedules.keys())
+        for key, sched in schedules.items():
+            for k, vals in sched.items():
+                np.testing.assert_array_equal(vals, full_schedules[key][k])
+
+    def test_update_season_stats_new_team(self):
+        # iowa isn't in the initial team list, so has to be added as its games come in
+        df_preseason = pd.DataFrame({"year":2020, "team_id":["purdue","indiana"], "pred_eff":[10.0,5.0],
+                                     "pred_oeff":[110.0,105.0], "pred_deff":[100.0,100.0], "pred_pace":[68.0,70.0]})
+        stats_df, schedules = utils.compute_season_stats_df(self.df.iloc[:1], df_preseason=df_preseason,
+                                                            force_all_teams=True, tids=["purdue", "indiana"], years=[2020])
+        utils.update_season_stats(stats_df, schedules, self.df.iloc[1:])
+        full_df, full_schedules = utils.compute_season_stats_df(self.df, df_preseason=df_preseason)
+
+        stats_df = stats_df.sort_values(["year","team_id"]).reset_index(drop=True)
+        pd.testing.assert_frame_equal(stats_df, full_df)
+        self.assertEqual(list(schedules[(2020,"iowa")]["opps"]), ["indiana", "purdue"])
+        self.assertEqual(list(schedules[(2020,"iowa")]["nOT"]), [1, 0])
+
+    def test_compile_training_data(self):
+        # compare against a row-by-row reference, which is how the training splits were originally drawn.
+        # the vectorized version must consume the random stream identically, or every split changes
+        rng = np.random.RandomState(1)
+        tids = ["indiana", "iowa", "michigan", "purdue", "wisconsin"]
+        feats = ["pace","Tneteff","Tcorroeff","Tcorrdeff","CompositeRating","Teff","Oeff"] + \
+                ["Tcorro"+stat for stat in utils.ADVSTATNAMES] + ["Tcorrd"+stat for stat in utils.ADVSTATNAMES]
+        stats = {year:{tid:{f:rng.normal(100, 10) for f in feats} for tid in tids} for year in (2019, 2020)}
+        ngames = 50
+        df = pd.DataFrame({"Season":rng.choice([2019, 2020], ngames), "Date":"2020-01-01", "WLoc":rng.choice(list("HAN"), ngames),
+                           "WScore":rng.randint(60, 90, ngames), "LScore":rng.randint(40, 60, ngames),
+                           "Wrank":rng.randint(1, 26, ngames), "Lrank":rng.randint(1, 26, ngames),
+                           "NumOT":rng.randint(0, 2, ngames), "poss":rng.uniform(60, 75, ngames)})
+        pairs = [rng.choice(tids, 2, replace=False) for i in range(ngames)]
+        df["WTeamID"] = [p[0] for p in pairs]
+        df["LTeamID"] = [p[1] for p in pairs]
+        df["gid"] = [f"2020-01-01_{min(p)}_{max(p)}" for p in pairs]
+
+        for sort in ("random", "alphabetical"):
+            data = utils.compile_training_data(df, stats, random_seed=3, sort=sort)
+            np.random.seed(3)
+            for i, row in enumerate(df.itertuples()):
+                dowin = np.random.randint(2) if sort=="random" else (row.WTeamID < row.LTeamID)
+                id1, id2 = (row.WTeamID, row.LTeamID) if dowin else (row.LTeamID, row.WTeamID)
+                d1, d2 = stats[row.Season][id1], stats[row.Season][id2]
+                mult = 1 if dowin else -1
+                self.assertEqual(bool(data.result[i]), bool(dowin))
+                self.assertEqual((data.tid1[i], data.tid2[i]), (id1, id2))
+                self.assertEqual(data.margin[i], (row.WScore-row.LScore)*mult)
+                self.assertEqual(data.HA[i], ("ANH".find(row.WLoc)-1)*mult)
+                self.assertEqual(data.rank1[i], row.Wrank if dowin else row.Lrank)
+                self.assertAlmostEqual(data.effdiff[i], d1["Tneteff"] - d2["Tneteff"])
+                self.assertAlmostEqual(data.pace2[i], d2["pace"])
+                self.assertAlmostEqual(data.Tefgp[i], d1["Tcorroefgp"] - d2["Tcorroefgp"])
+
+        with self.assertRaises(Exception):
+            utils.compile_training_data(df, stats, sort="bogus")
+
+    def test_save_load_season_stats(self):
+        stats_df, _ = utils.compute_season_stats_df(self.df)
+        stats_dict = utils.stats_df_to_dict(stats_df)
+        date = dt.date(2019,11,13)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(FileNotFoundError):
+                utils.load_season_stats(tmpdir, date)
+
+            utils.save_season_stats(tmpdir, date, stats_dict, stats_df, threads=0)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, f"{date}.pkl.zst")))
+            loaded_dict, loaded_df = utils.load_season_stats(tmpdir, date)
+            self.assertEqual(loaded_dict, stats_dict)
+            pd.testing.assert_frame_equal(loaded_df, stats_df)
+
+            # snapshots written before the switch to zstandard are gzipped pickles
+            olddate = dt.date(2019,11,12)
+            with gzip.open(os.path.join(tmpdir, f"{olddate}.pkl.gz"), 'wb') as fid:
+                pickle.dump((stats_dict, stats_df), fid, protocol=-1)
+            loaded_dict, loaded_df = utils.load_season_stats(tmpdir, olddate)
+            self.assertEqual(loaded_dict, stats_dict)
+            pd.testing.assert_frame_equal(loaded_df, stats_df)
+
+    def test_is_rivalry(self):
+        df = pd.DataFrame({"gid":["2020-02-08_duke_north-carolina", "2020-02-15_iowa_purdue",
+                                  "2020-01-25_kansas_kansas-state"]})
+        self.assertEqual(list(df.apply(utils.is_rivalry, axis=1)), [True, False, True])
+        self.assertEqual(list(utils.vec_is_rivalry(df)), [True, False, True])
+
+if __name__=="__main__":
+    unittest.main()
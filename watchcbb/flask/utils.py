@@ -2,10 +2,8 @@
 Helper functions for main flask app
 """
 
-import os
 import datetime as dt
 import pickle
-import gzip
 
 from flask import Markup
 
@@ -23,9 +21,8 @@ def parse_date_string(datestr):
     return dt.date(*[int(x) for x in datestr.split('-')])
 
 def load_season_stats(pickle_dir, date):
-    """ load season stats dict/dataframe from gzipped pickle """
-    with gzip.open(os.path.join(pickle_dir,"{0}.pkl.gz".format(date)), 'rb') as fid:
-        season_stats_dict, season_stats_df = pickle.load(fid)
+    """ load season stats dict/dataframe from compressed pickle """
+    season_stats_dict, season_stats_df = utils.load_season_stats(pickle_dir, date)
     return season_stats_dict, season_stats_df
 
 
@@ -131,7 +128,7 @@ def make_predictions(data, s1, s2, s3, season_frac, mean_pace, std_pace):
     data["pred_pace"] = (data["pred_pace"] - mean_pace) / std_pace
     data["abs_pred_margin"] = data["pred_margin"].abs()
     data["upset_prob"] = data.apply(utils.get_df_upset_prob, axis=1)
-    data["is_rivalry"] = data.apply(utils.is_rivalry, axis=1).astype(int)
+    data["is_rivalry"] = utils.vec_is_rivalry(data).astype(int)
     
     data["reddit_score"] = 10**linreg_reddit.predict(
         np.array([data.compratsum, data.upset_prob**2, data.abs_pred_margin, data.is_rivalry, data.pred_pace]).T
@@ -103,7 +103,7 @@ def get_games():
     df_games.Wrank = df_games.WTeamID.apply(lambda tid: futils.get_rank(ranks, tid)).fillna(-1)
     df_games.Lrank = df_games.LTeamID.apply(lambda tid: futils.get_rank(ranks, tid)).fillna(-1)
 
-    # load season stats from gzipped pickles
+    # load season stats from compressed pickles
     try:
         season_stats_dict, season_stats_df = futils.load_season_stats('data/season_stats/2020', date)
     except:
@@ -1,7 +1,10 @@
+import csv
 import datetime as dt
 import gzip
+from concurrent.futures import ThreadPoolExecutor
 
 from bs4 import BeautifulSoup
+import lxml.html
 
 import numpy as np
 import pandas as pd
@@ -26,7 +29,7 @@ class SportsRefScrape:
 
         teams_url = f"http://www.sports-reference.com/cbb/seasons/{season}-school-stats.html"
         teams_html = get_html(teams_url)
-        teams_soup = BeautifulSoup(teams_html, "html.parser")
+        teams_soup = BeautifulSoup(teams_html, "lxml")
         teams = []
         table = teams_soup.find("table", id="basic_school_stats").find("tbody")
         for td in table.find_all("td", {"data-stat":"school_name"}):
@@ -36,7 +39,7 @@ class SportsRefScrape:
         return teams
 
 
-    def get_game_data(self, season, fout=None, overwrite=False, gids=None, teams=None, startdate=None, enddate=None, verbose=False):
+    def get_game_data(self, season, fout=None, overwrite=False, gids=None, teams=None, startdate=None, enddate=None, verbose=False, cache=False, force_refresh=False):
         """Retrieve individual game statistics for a set of teams in a given season
         
         Parameters:
@@ -49,6 +52,9 @@ class SportsRefScrape:
         startdate: date to start retrieving games, defaults to beginning of season
         enddate: date to end retrieving games, defaults to full season
         verbose: print extra info
+        cache: use/save copies of the downloaded pages on disk (see scrape.common.get_html).
+               Only sensible for seasons that are over, since pages for the current season change daily
+        force_refresh: re-download (and re-cache) pages even if they are in the cache
 
         Returns: list of comma-separated strings, as would be written into the lines of a CSV
         """
@@ -66,137 +72,177 @@ class SportsRefScrape:
             teams = [gid.split("_")[1] for gid in gids]
             teams = list(set(teams))
             
-        gids = {}
-        lines = {}
+        seen = set()
+        old_rows = []
         rows = []
 
         # if we want to update the game file, record everything in the old file
         if fout is not None and overwrite==False:
-            for line in open(fout).readlines()[1:]:
-                sp = line.strip().split(",")
-                date = sp[1]
-                gid = self.get_gid(date,sp[3], sp[5])
-                if date not in gids.keys():
-                    gids[date] = []
-                    lines[date] = []
-                lines[date].append(line)
-                gids[date].append(gid)
-
-        stats = ["pts","fg","fga","fg3","fg3a","ft","fta","orb","trb","ast","stl","blk","tov","pf"]
-        for team in teams:
+            with open(fout, newline='') as fid:
+                reader = csv.reader(fid)
+                next(reader)
+                for sp in reader:
+                    seen.add(self.get_gid(sp[1], sp[3], sp[5]))
+                    old_rows.append(sp)
+
+        # schedule page only for "game type" (reg season, conf tourney, etc.) If before March, guaranteed Reg Season
+        get_gtype = enddate==None or enddate.month >= 2
+
+        # fetch all of the pages concurrently up front, since this is almost entirely network-bound.
+        # get_html releases the GIL while waiting on the socket, so plain threads overlap the requests.
+        # at most 8 teams are fetched at once, to be polite to the site
+        if verbose:
+            print(f"Downloading pages for {len(teams)} teams...")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            htmls = list(executor.map(lambda team: self.fetch_team(team, season, get_gtype, cache=cache, force_refresh=force_refresh), teams))
+
+        # parsing is CPU-bound, so there is nothing to gain from doing it in the threads
+        for team, team_htmls in zip(teams, htmls):
             if verbose:
                 print("Getting games for "+team+"...")
+            rows += self.parse_team(team, team_htmls, season, seen, gids_to_get, startdate, enddate)
 
-            url = f"http://www.sports-reference.com/cbb/schools/{team}/{season}-gamelogs.html"
-            html = get_html(url)
-            soup = BeautifulSoup(html, "html.parser")
+        colnames = ["Season","Date","Type","WTeamID","WScore","LTeamID","LScore","WLoc","NumOT",
+                    "WFGM","WFGA","WFGM3","WFGA3","WFTM","WFTA","WOR","WDR","WAst","WTO","WStl",
+                    "WBlk","WPF","LFGM","LFGA","LFGM3","LFGA3","LFTM","LFTA","LOR","LDR","LAst",
+                    "LTO","LStl","LBlk","LPF"
+        ]
+        if fout:
+            # stable sort, so games on the same date stay in the order they were found
+            out_rows = sorted(old_rows + rows, key=lambda r: r[1])
+            with open(fout, 'w', newline='') as fid:
+                writer = csv.writer(fid, lineterminator='\n')
+                writer.writerow(colnames)
+                writer.writerows(out_rows)
 
-            # this page only for "game type" (reg season, conf tourney, etc.) If before March, guaranteed Reg Season
-            if enddate==None or enddate.month >= 2:
-                url2 = "http://www.sports-reference.com/cbb/schools/{0}/{1}-schedule.html".format(team,season)
-                html2 = get_html(url2)
-                soup2 = BeautifulSoup(html2, "html.parser")
+        return pd.DataFrame(rows, columns=colnames)
 
-            table = soup.find("table", id="sgl-basic").find("tbody")
-            for tr in table.find_all("tr"):
-                if tr.get("id") == None:
-                    continue
 
-                date = tr.find("td", {"data-stat":"date_game"})
-                if date.find("a") != None:
-                    date = date.find("a").string
-                else:
-                    continue
-                opp = tr.find("td", {"data-stat":"opp_id"})
+    def fetch_team(self, team, season, get_schedule=True, cache=False, force_refresh=False):
+        """Download the pages needed by get_game_data for a single team
+        
+        cache, force_refresh are as in get_game_data
 
-                if startdate!=None and startdate > dt.date(*[int(x) for x in date.split("-")]):
-                    continue 
+        Returns: 2-tuple of html sources (gamelogs, schedule). schedule is None if get_schedule is False
+        """
 
-                if enddate!=None and enddate < dt.date(*[int(x) for x in date.split("-")]):
-                    continue 
+        gamelogs_html = get_html(f"http://www.sports-reference.com/cbb/schools/{team}/{season}-gamelogs.html",
+                                 cache=cache, force_refresh=force_refresh)
+        schedule_html = None
+        if get_schedule:
+            schedule_html = get_html(f"http://www.sports-reference.com/cbb/schools/{team}/{season}-schedule.html",
+                                     cache=cache, force_refresh=force_refresh)
 
-                if opp.find("a")==None:
-                    continue
-                opp = opp.find("a")["href"].split("/")[3]
-                gid = self.get_gid(date, team, opp)
+        return gamelogs_html, schedule_html
 
-                if gids_to_get is not None and gid not in gids_to_get:
-                    continue
 
-                datem1day = str(dt.date(*[int(x) for x in date.split("-")]) - dt.timedelta(1))
-                gidm1day = self.get_gid(datem1day, team, opp)
-                if date not in gids.keys():
-                    gids[date] = []
-                    lines[date] = []                
-                if gid in gids[date] or (datem1day in gids.keys() and gidm1day in gids[datem1day]):
-                    continue
-                else:
-                    gids[date].append(gid)
-
-                if enddate==None or enddate.month >= 2:
-                    gtype = soup2.find("td",{"csk":date}).find_parent("tr").find("td",{"data-stat":"game_type"}).string
-                else:
-                    gtype = "REG"
-                if gtype == "REG":
-                    gtype = "RG"
-                if gtype == "CTOURN":
-                    gtype = "CT"
-
-                loc = tr.find("td", {"data-stat":"game_location"}).string
-                if loc==None:    loc="H"
-                elif loc=="@": loc="A"
-                elif loc=="N": loc="N"
-                else:
-                    raise Exception(loc)
-
-                numot = tr.find("td", {"data-stat":"game_result"})
-                if numot.find("small") != None:
-                    numot = int(numot.find("small").string.split("(")[1].split()[0])
-                else:
-                    numot = 0
-
-                statdict = {}
-                opp_statdict = {}
-                getint = lambda x: (0 if x is None else int(x))
-                for stat in stats:
-                    statdict[stat] = getint(tr.find("td",{"data-stat":stat}).string)
-                    opp_statdict[stat] = getint(tr.find("td",{"data-stat":"opp_"+stat}).string)
-
-                if statdict["pts"] > opp_statdict["pts"]:
-                    wd, ld = statdict, opp_statdict
-                    wteam, lteam = team, opp
-                else:
-                    wd, ld = opp_statdict, statdict
-                    wteam, lteam = opp, team
-                    if loc=="H":   loc="A"
-                    elif loc=="A": loc="H"
-
-                rowvals = [season,date,gtype,wteam,wd["pts"],lteam,ld["pts"],loc,numot,
-                           wd["fg"],wd["fga"],wd["fg3"],wd["fg3a"],wd["ft"],wd["fta"],wd["orb"],
-                           wd["trb"]-wd["orb"],wd["ast"],wd["tov"],wd["stl"],wd["blk"],wd["pf"],
-                           ld["fg"],ld["fga"],ld["fg3"],ld["fg3a"],ld["ft"],ld["fta"],ld["orb"],
-                           ld["trb"]-ld["orb"],ld["ast"],ld["tov"],ld["stl"],ld["blk"],ld["pf"]
-                ]
-                rows.append(rowvals)
-
-                string = ",".join([str(x) for x in rowvals]) + '\n'
-
-                lines[date].append(string)
+    def parse_team(self, team, htmls, season, seen, gids_to_get=None, startdate=None, enddate=None):
+        """Parse the games out of the pages returned by fetch_team for a single team
+        
+        Games whose gid (or gid shifted back one day) is already in the set seen are skipped,
+        and the gids of new games are added to it. Other parameters are as in get_game_data
 
-        colnames = ["Season","Date","Type","WTeamID","WScore","LTeamID","LScore","WLoc","NumOT",
-                    "WFGM","WFGA","WFGM3","WFGA3","WFTM","WFTA","WOR","WDR","WAst","WTO","WStl",
-                    "WBlk","WPF","LFGM","LFGA","LFGM3","LFGA3","LFTM","LFTA","LOR","LDR","LAst",
-                    "LTO","LStl","LBlk","LPF"
-        ]
-        if fout:
-            fout = open(fout, 'w')
-            fout.write(",".join(colnames)+'\n')
-            for date in sorted(gids.keys()):
-                for s in lines[date]:
-                    fout.write(s)
-            fout.close()
+        Returns: list of tuples, one per game, in the column order of the get_game_data CSV
+        """
 
-        return pd.DataFrame(rows, columns=colnames)
+        gamelogs_html, schedule_html = htmls
+
+        # a rate-limited, missing, or redesigned page has no table. Fail loudly rather than return no games
+        table = lxml.html.fromstring(gamelogs_html).xpath('//table[@id="sgl-basic"]/tbody')
+        if len(table) == 0:
+            raise Exception(f"No game log table found for {team} in {season}")
+
+        # map date -> game type from the schedule page once, rather than searching it for every game
+        gtype_by_date = {}
+        if schedule_html is not None:
+            table2 = lxml.html.fromstring(schedule_html).xpath('//table[@id="schedule"]')
+            if len(table2) == 0:
+                raise Exception(f"No schedule table found for {team} in {season}")
+            for tr in table2[0].xpath('.//tr[td[@data-stat="game_type"]]'):
+                gtype = tr.xpath('td[@data-stat="game_type"]')[0].text
+                for td in tr.xpath('td[@csk]'):
+                    gtype_by_date.setdefault(td.get("csk"), gtype)
+
+        rows = []
+        stats = ["pts","fg","fga","fg3","fg3a","ft","fta","orb","trb","ast","stl","blk","tov","pf"]
+        for tr in table[0].xpath('tr[@id]'):
+            # map data-stat -> td once per row, rather than searching the row for every stat
+            cells = {td.get("data-stat"):td for td in tr.iterchildren("td")}
+
+            date = cells["date_game"]
+            if date.find("a") is not None:
+                date = date.find("a").text
+            else:
+                continue
+            opp = cells["opp_id"]
+
+            # parse the date once and reuse it for the date range and duplicate checks
+            y,m,d = date.split("-")
+            d_date = dt.date(int(y),int(m),int(d))
+
+            if startdate!=None and startdate > d_date:
+                continue 
+
+            if enddate!=None and enddate < d_date:
+                continue 
+
+            if opp.find("a") is None:
+                continue
+            opp = opp.find("a").get("href").split("/")[3]
+            gid = self.get_gid(date, team, opp)
+
+            if gids_to_get is not None and gid not in gids_to_get:
+                continue
+
+            datem1day = (d_date - dt.timedelta(1)).isoformat()
+            gidm1day = self.get_gid(datem1day, team, opp)
+            if gid in seen or gidm1day in seen:
+                continue
+            seen.add(gid)
+
+            gtype = gtype_by_date.get(date, "REG")
+            if gtype == "REG":
+                gtype = "RG"
+            if gtype == "CTOURN":
+                gtype = "CT"
+
+            loc = cells["game_location"].text
+            if loc==None:    loc="H"
+            elif loc=="@": loc="A"
+            elif loc=="N": loc="N"
+            else:
+                raise Exception(loc)
+
+            numot = cells["game_result"]
+            if numot.find("small") is not None:
+                numot = int(numot.find("small").text.split("(")[1].split()[0])
+            else:
+                numot = 0
+
+            statdict = {}
+            opp_statdict = {}
+            getint = lambda x: (0 if x is None else int(x))
+            for stat in stats:
+                statdict[stat] = getint(cells[stat].text)
+                opp_statdict[stat] = getint(cells["opp_"+stat].text)
+
+            if statdict["pts"] > opp_statdict["pts"]:
+                wd, ld = statdict, opp_statdict
+                wteam, lteam = team, opp
+            else:
+                wd, ld = opp_statdict, statdict
+                wteam, lteam = opp, team
+                if loc=="H":   loc="A"
+                elif loc=="A": loc="H"
+
+            rows.append((season,date,gtype,wteam,wd["pts"],lteam,ld["pts"],loc,numot,
+                         wd["fg"],wd["fga"],wd["fg3"],wd["fg3a"],wd["ft"],wd["fta"],wd["orb"],
+                         wd["trb"]-wd["orb"],wd["ast"],wd["tov"],wd["stl"],wd["blk"],wd["pf"],
+                         ld["fg"],ld["fga"],ld["fg3"],ld["fg3a"],ld["ft"],ld["fta"],ld["orb"],
+                         ld["trb"]-ld["orb"],ld["ast"],ld["tov"],ld["stl"],ld["blk"],ld["pf"]
+            ))
+
+        return rows
 
 
     def get_gids_on_date(self, startdate, enddate=None):
@@ -217,7 +263,7 @@ class SportsRefScrape:
                 date += dt.timedelta(1)
                 continue
 
-            soup = BeautifulSoup(html, 'html.parser')
+            soup = BeautifulSoup(html, 'lxml')
             for table in soup.find_all('table', {'class':'teams'}):
                 td = table.find_all("tr")[0].find("td")
                 a = td.find("a")
@@ -249,7 +295,7 @@ class SportsRefScrape:
 
         url = f'https://www.sports-reference.com/cbb/seasons/{season}-polls.html'
         html = get_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = BeautifulSoup(html, 'lxml')
 
         table = soup.find('table', {'id':'ap-polls'})
 
@@ -308,7 +354,7 @@ class SportsRefScrape:
             tablestartAdv = html.find('<table class="sortable stats_table" id="advanced"')
             tableendAdv = html.find("</table>",tablestartAdv)
             htmlAdv = html[tablestartAdv:tableendAdv+8]
-            soupAdv = BeautifulSoup(htmlAdv, "html.parser")
+            soupAdv = BeautifulSoup(htmlAdv, "lxml")
             tableAdv = soupAdv.find("table", {"id":"advanced"})
 
             if tableAdv is None:
@@ -1,10 +1,58 @@
+import os
+import gzip
+import hashlib
+
 import urllib3
+from urllib3.util.retry import Retry
+
+# shared across calls so that connections (and TLS sessions) are kept alive between requests.
+# rate-limited (429) and transient server errors are retried with backoff, honoring any Retry-After
+_POOL = urllib3.PoolManager(maxsize=16, retries=Retry(total=3, backoff_factor=0.3,
+                                                      status_forcelist=[429,500,502,503,504],
+                                                      respect_retry_after_header=True))
+
+# where downloaded pages are cached on disk, as gzipped files named by the hash of the url
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "../../data/html_cache")
+
+def _cache_path(url):
+    return os.path.join(CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".html.gz")
+
+def _read_cache(url):
+    """Return the cached html source of url, or None if it isn't cached"""
+    path = _cache_path(url)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, 'rb') as fid:
+        return fid.read()
+
+def _write_cache(url, data):
+    """Save the html source of url to the cache"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(url)
+    # write to a temporary file first so an interrupted write can't leave a truncated page behind
+    with gzip.open(path + ".tmp", 'wb') as fid:
+        fid.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def get_html(url, cache=False, force_refresh=False):
+    """
+    Use urllib3 to retrieve the html source of a given url. Raises if the response isn't a 200
+    If cache, use the copy saved on disk in CACHE_DIR if there is one, and save a copy otherwise.
+    force_refresh re-downloads (and re-caches) the page even if it is cached,
+    e.g. for pages that are still changing like the current season's
+    """
+
+    if cache and not force_refresh:
+        data = _read_cache(url)
+        if data is not None:
+            return data
 
-def get_html(url):
-    """Use urllib3 to retrieve the html source of a given url"""
+    r = _POOL.request('GET', url, headers={'Accept-Encoding':'gzip'})
+    # never hand back (or worse, cache) an error page as if it were the real thing
+    if r.status != 200:
+        raise Exception(f"Got HTTP status {r.status} for {url}")
+    if cache:
+        _write_cache(url, r.data)
+    return r.data
 
-    http = urllib3.PoolManager()
-    r = http.request('GET', url)
-    data = r.data
-    r.release_conn()
-    return data
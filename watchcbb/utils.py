@@ -3,6 +3,7 @@ import pickle
 import gzip
 from collections import defaultdict
 from tqdm import tqdm
+import zstandard as zstd
 
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
@@ -17,8 +18,8 @@ STATNAMES = ["Score","FGM","FGA","FGM3","FGA3","FTM","FTA","OR","DR","Ast","TO",
 ADVSTATNAMES = ['eff','astr','orbp','tovr','efgp','ftr']
 ADVSTATFEATURES = ["T"+stat for stat in ADVSTATNAMES] + ["O"+stat for stat in ADVSTATNAMES]
 PCAFEATURES = [f"PCA{i}" for i in range(len(ADVSTATFEATURES))]
-RIVALRIES = [tuple(sorted([x.strip() for x in line.split(',')])) \
-             for line in open(os.path.join(os.path.dirname(__file__),'../data/rivalries.txt'))]
+with open(os.path.join(os.path.dirname(__file__),'../data/rivalries.txt')) as fid:
+    RIVALRIES = frozenset(tuple(sorted([x.strip() for x in line.split(',')])) for line in fid)
 
 def partition_games(df, frac=0.7):
     """
@@ -39,19 +40,45 @@ def partition_games(df, frac=0.7):
     return first, second
 
 
-def compute_season_stats(df, df_preseason=None, force_all_teams=False, tids=None, years=None):
+def _team_games(df):
+    """
+    Stack the per-game data frame so that there is one row per team per game,
+    with the team's stats in T<stat> columns and its opponent's in O<stat> columns.
+    Rows stay in the original game order.
+    """
+    wcols = ["W"+sn for sn in STATNAMES]
+    lcols = ["L"+sn for sn in STATNAMES]
+    cols = ["Season","WTeamID","LTeamID","WLoc","NumOT","poss"] + wcols + lcols
+
+    df = df[cols].reset_index(drop=True)
+    winners = df.rename(columns={"WTeamID":"team", "LTeamID":"opp", "WLoc":"HA",
+                                 **{"W"+sn:"T"+sn for sn in STATNAMES},
+                                 **{"L"+sn:"O"+sn for sn in STATNAMES}})
+    winners["win"] = 1
+    losers = df.rename(columns={"LTeamID":"team", "WTeamID":"opp", "WLoc":"HA",
+                                **{"L"+sn:"T"+sn for sn in STATNAMES},
+                                **{"W"+sn:"O"+sn for sn in STATNAMES}})
+    losers["HA"] = losers.HA.map({"H":"A", "A":"H", "N":"N"})
+    losers["win"] = 0
+
+    games = pd.concat([winners, losers]).sort_index(kind="stable")
+    games["loss"] = 1 - games.win
+    return games
+
+
+def compute_season_stats_df(df, df_preseason=None, force_all_teams=False, tids=None, years=None):
     """
     Take the per-game data frame and aggregate stats on a per team/season basis
-    Returns a dict structured like stats[year][team_id][stat_name]
+    Returns a 2-tuple (stats_df, schedules):
+      stats_df is a DataFrame with one team/season pair per row
+      schedules is a dict keyed by (year, team_id), holding the per-game numpy arrays
+        opps, scores (n x 2), HA, poss, nOT needed by efficiency.compute_efficiency_ratings
     If df_preseason is not None, also include preseason predictions of efficiency/pace
     If force_all_teams, include all teams even if they haven't played any games yet
       (if this is True, must also pass list of tids)
       If years is not None, force include all years in that list
     """
 
-    if df_preseason is not None:
-        dict_preseason = stats_df_to_dict(df_preseason)
-
     if force_all_teams:
         if tids is None:
             raise Exception("Must pass a df_teams if force_all_teams is True")
@@ -59,93 +86,91 @@ def compute_season_stats(df, df_preseason=None, force_all_teams=False, tids=None
     if years is None:
         years = df.Season.unique()
 
-    def init_team_dict(d, year, tid):
-        if year not in d:
-            raise Exception(f"{year} must be a key of dictionary")
-        if tid in d[year]:
-            raise Exception(f"team_id {tid} already initialized in dictionary")
-        d[year][tid] = {}
-        d[year][tid]["wins"] = 0
-        d[year][tid]["losses"] = 0
-        d[year][tid]["totOT"] = 0
-        d[year][tid]["totPoss"] = 0
-        d[year][tid]["opps"] = []
-        d[year][tid]["scores"] = []
-        d[year][tid]["HA"] = []
-        d[year][tid]["poss"] = []
-        d[year][tid]["nOT"] = []
-        for sn in STATNAMES:
-            d[year][tid]["T"+sn] = 0
-            d[year][tid]["O"+sn] = 0
-        if df_preseason is not None:
-            d[year][tid]["preseason_eff"] = dict_preseason[year].get(tid,{}).get("pred_eff", -10.0)
-            d[year][tid]["preseason_oeff"] = dict_preseason[year].get(tid,{}).get("pred_oeff", -10.0)
-            d[year][tid]["preseason_deff"] = dict_preseason[year].get(tid,{}).get("pred_deff", -10.0)
-            d[year][tid]["preseason_pace"] = dict_preseason[year].get(tid,{}).get("pred_pace", -10.0)
+    for year in df.Season.unique():
+        if year not in years:
+            raise Exception(f"{year} must be in list of years")
+
+    games = _team_games(df)
+    grouped = games.groupby(["Season","team"])
+
+    # additive stats, summed over all games for each team/season.
+    # label every game with its (sorted) team/season group number and accumulate each
+    # stat with a weighted bincount, rather than going through the generic groupby reduction
+    sumcols = ["win","loss","NumOT"] + ["T"+sn for sn in STATNAMES] + ["O"+sn for sn in STATNAMES] + ["poss"]
+    codes = grouped.ngroup().values
+    keys = grouped.size().index
+    agg = pd.DataFrame({col:np.bincount(codes, weights=games[col].values, minlength=len(keys)).astype(games[col].dtype)
+                        for col in sumcols}, index=keys)
+    agg = agg.rename(columns={"win":"wins", "loss":"losses", "NumOT":"totOT", "poss":"totPoss"})
+
+    # per-game schedules, needed for strength-of-schedule corrections.
+    # stored CSR-style: each field is one contiguous array over all games, ordered by team/season
+    # (stable, so each team's games stay in date order), and each team's schedule is a view onto its slice
+    order = np.argsort(codes, kind="stable")
+    flat = {
+        "opps": games.opp.values[order].astype(str),
+        "scores": np.column_stack([games.TScore.values, games.OScore.values])[order],
+        "HA": games.HA.values[order].astype(str),
+        "poss": games.poss.values[order].astype(float),
+        "nOT": games.NumOT.values[order],
+        }
+    bounds = np.cumsum(np.bincount(codes, minlength=len(keys))).tolist()
+    offsets = dict(zip(keys, zip([0]+bounds[:-1], bounds)))
+
+    # force initialization of all teams, even if they've played no games yet
+    index = agg.index
+    if force_all_teams:
+        index = index.union(pd.MultiIndex.from_product([years, tids]))
+    agg = agg.reindex(index, fill_value=0).sort_index()
 
-    stats = {}
+    if df_preseason is not None:
+        pre = df_preseason.set_index(["year","team_id"])[["pred_eff","pred_oeff","pred_deff","pred_pace"]]
+        pre.columns = ["preseason_eff","preseason_oeff","preseason_deff","preseason_pace"]
+        agg = agg.join(pre.reindex(agg.index).fillna(-10.0))
 
-    # initialize all years
-    for year in years:
-        stats[year] = {}
-        # force initialization of all teams, even if they've played no games yet
-        if force_all_teams:
-            for tid in tids:
-                init_team_dict(stats, year, tid)
-
-    for irow,row in df.iterrows():
-        year = row.Season
-        wid = row.WTeamID
-        lid = row.LTeamID
-
-        # initialize values if we haven't seen this team yet
-        for tid in (wid,lid):
-            if tid not in stats[year]:
-                init_team_dict(stats, year, tid)
-
-        for sn in STATNAMES:
-            stats[year][wid]["T"+sn] += row["W"+sn]
-            stats[year][wid]["O"+sn] += row["L"+sn]
-            stats[year][lid]["T"+sn] += row["L"+sn]
-            stats[year][lid]["O"+sn] += row["W"+sn]
-        stats[year][wid]["wins"] += 1
-        stats[year][lid]["losses"] += 1
-        stats[year][wid]["totOT"] += row.NumOT
-        stats[year][lid]["totOT"] += row.NumOT
-        stats[year][wid]["totPoss"] += row.poss
-        stats[year][lid]["totPoss"] += row.poss
-        stats[year][wid]["opps"].append(lid)
-        stats[year][lid]["opps"].append(wid)
-        stats[year][wid]["scores"].append((row.WScore,row.LScore))
-        stats[year][lid]["scores"].append((row.LScore,row.WScore))
-        stats[year][wid]["HA"].append(row.WLoc)
-        stats[year][lid]["HA"].append('HNA'['ANH'.find(row.WLoc)])
-        stats[year][wid]["poss"].append(row.poss)
-        stats[year][lid]["poss"].append(row.poss)
-        stats[year][wid]["nOT"].append(row.NumOT)
-        stats[year][lid]["nOT"].append(row.NumOT)
+    schedules = {}
+    for key in agg.index:
+        start, stop = offsets.get(key, (0,0))
+        schedules[key] = {name:vals[start:stop] for name,vals in flat.items()}
 
-    return stats
+    agg.index.names = ["year","team_id"]
+    return agg.reset_index(), schedules
 
 
-def stats_dict_to_df(stats):
+def update_season_stats(stats_df, schedules, df):
     """
-    Convert a dict of aggregated season stats (as returned by compute_season_stats)
-    into a DataFrame, with one team/season pair per row
-    """    
-    ascols = defaultdict(list)
-    for year in sorted(stats.keys()):
-        for tid in sorted(stats[year].keys()):
-            ascols["year"].append(year)
-            ascols["team_id"].append(tid)
-            for s in stats[year][tid].keys():
-                ascols[s].append(stats[year][tid][s])
-
-    columns = ["year","team_id","wins","losses","totOT"] + \
-              ["T"+sn for sn in STATNAMES] + ["O"+sn for sn in STATNAMES]
-    columns += list(set(stats[year][tid].keys())-set(columns))
-
-    return pd.DataFrame(ascols, columns=columns)
+    Fold the games in the per-game data frame df into season stats
+    (stats_df, schedules) previously returned by compute_season_stats_df.
+    Both are updated in place. A team in df that doesn't have a row in stats_df yet
+    (e.g. one missing from the teams table passed as tids) gets a new row, starting from zero
+    """
+    if df.shape[0] == 0:
+        return
+
+    new_df, new_schedules = compute_season_stats_df(df)
+    cols = list(new_df.columns[2:])
+
+    keys = pd.MultiIndex.from_frame(stats_df[["year","team_id"]])
+    new_keys = pd.MultiIndex.from_frame(new_df[["year","team_id"]])
+    for year, tid in new_keys[keys.get_indexer(new_keys) < 0]:
+        # same defaults that compute_season_stats_df gives a team with no games/preseason prediction
+        row = {"year":year, "team_id":tid}
+        row.update({col:0 for col in cols})
+        row.update({col:-10.0 for col in stats_df.columns if col.startswith("preseason_")})
+        stats_df.loc[stats_df.index.max()+1 if stats_df.shape[0] > 0 else 0] = pd.Series(row)
+    keys = pd.MultiIndex.from_frame(stats_df[["year","team_id"]])
+    rows = keys.get_indexer(new_keys)
+
+    # everything computed from the games is additive
+    labels = stats_df.index[rows]
+    stats_df.loc[labels, cols] = stats_df.loc[labels, cols].values + new_df[cols].values
+
+    for key, sched in new_schedules.items():
+        if key not in schedules:
+            schedules[key] = sched
+            continue
+        for k, vals in sched.items():
+            schedules[key][k] = np.concatenate([schedules[key][k], vals])
 
 
 def stats_df_to_dict(df):
@@ -155,28 +180,32 @@ def stats_df_to_dict(df):
     Assumes the first two columns of df are ['year','team_id']
     """ 
     stats = {}
-    for irow, row in df.iterrows():
-        if row.year not in stats:
-            stats[row.year] = {}
-        if row.team_id not in stats[row.year]:
-            stats[row.year][row.team_id] = {}
-        for col in df.columns[2:]:
-            stats[row.year][row.team_id][col] = row[col]
+    keys = zip(df.iloc[:,0], df.iloc[:,1])
+    for (year, tid), d in zip(keys, df.iloc[:,2:].to_dict("records")):
+        if year not in stats:
+            stats[year] = {}
+        stats[year][tid] = d
     return stats
 
 def add_advanced_stats(df):
     """ Add some advanced stats to a season stats dataframe """
-    # compute advanced stats
-    for c in ('T','O'):
-        opp = 'T' if c=='O' else 'O'
-        df[c+'poss'] = df[c+"FGA"] + 0.44*df[c+"FTA"] - df[c+"OR"] + df[c+"TO"]
-        df[c+'eff'] = 100. * df[c+"Score"] / df[c+"poss"]
-        df[c+'astr'] = df[c+"Ast"] / (df[c+"FGA"] + 0.44*df[c+"FTA"] + df[c+"Ast"] + df[c+"TO"])
-        df[c+'tovr'] = df[c+"TO"] / (df[c+"FGA"] + 0.44*df[c+"FTA"] + df[c+"TO"])
-        df[c+'efgp'] = (df[c+"FGM"] + 0.5*df[c+"FGM3"]) / df[c+"FGA"]
-        df[c+'orbp'] = df[c+'OR'] / (df[c+'OR'] + df[opp+'DR'])
-        df[c+'ftr'] = df[c+"FTA"] / df[c+"FGA"]
-    df['rawpace'] = 0.5*(df["Tposs"]+df["Oposs"]) / (df["wins"] + df["losses"] + 0.125*df["totOT"])
+    # do the arithmetic on plain numpy arrays and assign all new columns at once at the end,
+    # rather than paying the pandas per-column overhead for every operation
+    cols = ["wins","losses","totOT"] + ["T"+sn for sn in STATNAMES] + ["O"+sn for sn in STATNAMES]
+    v = dict(zip(cols, df[cols].to_numpy(dtype=float).T))
+    adv = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for c in ('T','O'):
+            opp = 'T' if c=='O' else 'O'
+            adv[c+'poss'] = v[c+"FGA"] + 0.44*v[c+"FTA"] - v[c+"OR"] + v[c+"TO"]
+            adv[c+'eff'] = 100. * v[c+"Score"] / adv[c+"poss"]
+            adv[c+'astr'] = v[c+"Ast"] / (v[c+"FGA"] + 0.44*v[c+"FTA"] + v[c+"Ast"] + v[c+"TO"])
+            adv[c+'tovr'] = v[c+"TO"] / (v[c+"FGA"] + 0.44*v[c+"FTA"] + v[c+"TO"])
+            adv[c+'efgp'] = (v[c+"FGM"] + 0.5*v[c+"FGM3"]) / v[c+"FGA"]
+            adv[c+'orbp'] = v[c+'OR'] / (v[c+'OR'] + v[opp+'DR'])
+            adv[c+'ftr'] = v[c+"FTA"] / v[c+"FGA"]
+        adv['rawpace'] = 0.5*(adv["Tposs"]+adv["Oposs"]) / (v["wins"] + v["losses"] + 0.125*v["totOT"])
+    df[list(adv.keys())] = np.column_stack(list(adv.values()))
 
 
 
@@ -192,47 +221,65 @@ def compile_training_data(df, season_stats_dict, random_seed=0, sort='random', i
                          these must be present in season_stats_dict
     """
     np.random.seed(random_seed)
-    data = defaultdict(list)
-    for irow, row in df.iterrows():
-        d = season_stats_dict[row.Season]
-        if sort=='random':
-            dowin = np.random.randint(2)
-        elif sort=='alphabetical':
-            dowin = (row.WTeamID < row.LTeamID)
-        else:
-            raise Exception("Illegal sort parameter "+sort)
-        id1, id2 = row.WTeamID, row.LTeamID
-        mult = (1 if dowin else -1)
-        if not dowin:
-            id1, id2 = id2, id1
-        data['result'].append(dowin)
-        data['margin'].append((row.WScore-row.LScore)*mult)
-        data['totscore'].append(row.WScore+row.LScore)
-        data['date'].append(row.Date)
-        data['season'].append(row.Season)
-        data['gid'].append(row.gid)
-        data['tid1'].append(id1)
-        data['tid2'].append(id2)
-        data['rank1'].append(row.Wrank if dowin else row.Lrank)
-        data['rank2'].append(row.Lrank if dowin else row.Wrank)
-        data['poss'].append(row.poss / (1.0 + 0.125*row.NumOT))
-        data['pace1'].append(d[id1]['pace'])
-        data['pace2'].append(d[id2]['pace'])
-        data['HA'].append(('ANH'.find(row.WLoc)-1) * mult)
-        if include_preseason:
-            data['preseason_effdiff'].append(d[id1]["preseason_eff"] - d[id2]["preseason_eff"])
-            data['preseason_effsum'].append(d[id1]["preseason_oeff"] + d[id1]["preseason_deff"] + d[id2]["preseason_oeff"] + d[id2]["preseason_deff"])
-            data['preseason_paceprod'].append(d[id1]["preseason_pace"]*d[id2]["preseason_pace"])
-        data['effdiff'].append(d[id1]["Tneteff"] - d[id2]["Tneteff"])
-        data['effsum'].append(d[id1]["Tcorroeff"] + d[id1]["Tcorrdeff"] + d[id2]["Tcorroeff"] + d[id2]["Tcorrdeff"])
-        data['neteffsum'].append(d[id1]["Tcorroeff"] - d[id1]["Tcorrdeff"] + d[id2]["Tcorroeff"] - d[id2]["Tcorrdeff"])
-        data['compratsum'].append(d[id1]["CompositeRating"] + d[id2]["CompositeRating"])
-        data['raweffdiff'].append((d[id1]["Teff"] - d[id1]["Oeff"]) - \
-                                   (d[id2]["Teff"] - d[id2]["Oeff"]))
-        # 'T'+stat is difference in offensive stats between two teams. 'O'+stat is difference in defensive
-        for stat in ADVSTATNAMES:
-            data['T'+stat].append(d[id1]['Tcorro'+stat] - d[id2]['Tcorro'+stat])
-            data['O'+stat].append(d[id1]['Tcorrd'+stat] - d[id2]['Tcorrd'+stat])
+    if sort=='random':
+        dowin = np.random.randint(0, 2, size=df.shape[0])
+    elif sort=='alphabetical':
+        dowin = df.WTeamID.values < df.LTeamID.values
+    else:
+        raise Exception("Illegal sort parameter "+sort)
+    win = dowin.astype(bool)
+    mult = np.where(win, 1, -1)
+
+    # flatten the season stats into a dense (team/season, feature) matrix, so that all of the
+    # per-game lookups become a single fancy-index gather
+    feats = ["pace","Tneteff","Tcorroeff","Tcorrdeff","CompositeRating","Teff","Oeff"]
+    feats += ["Tcorro"+stat for stat in ADVSTATNAMES] + ["Tcorrd"+stat for stat in ADVSTATNAMES]
+    if include_preseason:
+        feats += ["preseason_eff","preseason_oeff","preseason_deff","preseason_pace"]
+    team_idx = {}
+    rows = []
+    for year in season_stats_dict:
+        for tid, d in season_stats_dict[year].items():
+            team_idx[(year,tid)] = len(rows)
+            rows.append([d[f] for f in feats])
+    feat = np.array(rows, dtype=float).reshape(-1, len(feats))
+    col = {f:i for i,f in enumerate(feats)}
+
+    iw = np.array([team_idx[key] for key in zip(df.Season, df.WTeamID)], dtype=int)
+    il = np.array([team_idx[key] for key in zip(df.Season, df.LTeamID)], dtype=int)
+    i1 = np.where(win, iw, il)
+    i2 = np.where(win, il, iw)
+    f1 = lambda name: feat[i1, col[name]]
+    f2 = lambda name: feat[i2, col[name]]
+
+    data = {}
+    data['result'] = dowin
+    data['margin'] = (df.WScore.values - df.LScore.values) * mult
+    data['totscore'] = df.WScore.values + df.LScore.values
+    data['date'] = df.Date.values
+    data['season'] = df.Season.values
+    data['gid'] = df.gid.values
+    data['tid1'] = np.where(win, df.WTeamID.values, df.LTeamID.values)
+    data['tid2'] = np.where(win, df.LTeamID.values, df.WTeamID.values)
+    data['rank1'] = np.where(win, df.Wrank.values, df.Lrank.values)
+    data['rank2'] = np.where(win, df.Lrank.values, df.Wrank.values)
+    data['poss'] = df.poss.values / (1.0 + 0.125*df.NumOT.values)
+    data['pace1'] = f1('pace')
+    data['pace2'] = f2('pace')
+    data['HA'] = df.WLoc.map({'A':-1, 'N':0, 'H':1}).values * mult
+    if include_preseason:
+        data['preseason_effdiff'] = f1("preseason_eff") - f2("preseason_eff")
+        data['preseason_effsum'] = f1("preseason_oeff") + f1("preseason_deff") + f2("preseason_oeff") + f2("preseason_deff")
+        data['preseason_paceprod'] = f1("preseason_pace")*f2("preseason_pace")
+    data['effdiff'] = f1("Tneteff") - f2("Tneteff")
+    data['effsum'] = f1("Tcorroeff") + f1("Tcorrdeff") + f2("Tcorroeff") + f2("Tcorrdeff")
+    data['neteffsum'] = f1("Tcorroeff") - f1("Tcorrdeff") + f2("Tcorroeff") - f2("Tcorrdeff")
+    data['compratsum'] = f1("CompositeRating") + f2("CompositeRating")
+    data['raweffdiff'] = (f1("Teff") - f1("Oeff")) - (f2("Teff") - f2("Oeff"))
+    # 'T'+stat is difference in offensive stats between two teams. 'O'+stat is difference in defensive
+    for stat in ADVSTATNAMES:
+        data['T'+stat] = f1('Tcorro'+stat) - f2('Tcorro'+stat)
+        data['O'+stat] = f1('Tcorrd'+stat) - f2('Tcorrd'+stat)
          
     columns = ['season', 'date', 'gid','tid1','tid2','result','rank1','rank2','totscore', 'margin', 
                'HA','poss','pace1','pace2','effdiff','raweffdiff','effsum']
@@ -258,6 +305,29 @@ def train_test_split_by_year(data, train_years, test_years, pca_model=None):
     
     return data_train, data_test
 
+def save_season_stats(pickle_dir, date, season_stats_dict, season_stats_df, threads=-1):
+    """
+    Pickle the season stats dict/dataframe as of <date> into a zstandard-compressed file in pickle_dir.
+    threads is the number of compression threads (-1 for one per core, 0 to compress in the calling thread)
+    """
+    cctx = zstd.ZstdCompressor(level=6, threads=threads)
+    with open(os.path.join(pickle_dir, f"{date}.pkl.zst"), 'wb') as fid, cctx.stream_writer(fid) as writer:
+        pickle.dump((season_stats_dict, season_stats_df), writer, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_season_stats(pickle_dir, date):
+    """
+    Load the season stats dict/dataframe as of <date> saved by save_season_stats.
+    Falls back to the older gzipped pickles (<date>.pkl.gz) if there is no zstandard file
+    """
+    fname = os.path.join(pickle_dir, f"{date}.pkl.zst")
+    if os.path.exists(fname):
+        with open(fname, 'rb') as fid, zstd.ZstdDecompressor().stream_reader(fid) as reader:
+            return pickle.load(reader)
+    with gzip.open(os.path.join(pickle_dir, f"{date}.pkl.gz"), 'rb') as fid:
+        return pickle.load(fid)
+
+
 def get_daily_predictions(dates, df_allgames, model_file, pickled_stats_dir, return_cols=None):
     """ 
     Make predictions for games on various dates, *with statistics as they were on that date*
@@ -289,8 +359,7 @@ def get_daily_predictions(dates, df_allgames, model_file, pickled_stats_dir, ret
         year = df_games.Season.values[0]
         total_games[year] += df_games.shape[0]
         try:
-            with gzip.open('{0}/{1}.pkl.gz'.format(pickled_stats_dir.format(year=year), date), 'rb') as fid:
-                ssd, _ = pickle.load(fid)
+            ssd, _ = load_season_stats(pickled_stats_dir.format(year=year), date)
         except FileNotFoundError:
             continue
         games = compile_training_data(df_games, ssd, sort='alphabetical', include_preseason=True)
@@ -367,6 +436,13 @@ def is_rivalry(row):
     return (tid1,tid2) in RIVALRIES
 
 
+def vec_is_rivalry(df):
+    """Vectorized version of is_rivalry. Returns a boolean array with an entry for each row of df"""
+    # gids are date_team1_team2 with the teams already sorted, same as the RIVALRIES tuples
+    matchups = df.gid.str.split('_', n=1).str[1]
+    return matchups.isin(['_'.join(r) for r in RIVALRIES]).values
+
+
 def get_blend_param(season_frac):
     """
     When <season_frac> of the season is completed, this returns the fraction of the prediction to take from preseason